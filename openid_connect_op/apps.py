@@ -26,6 +26,11 @@ class OpenIDConnectOPApp(AppConfig):
         if not hasattr(settings, 'OPENID_DEFAULT_REFRESH_TOKEN_TTL'):
             settings.OPENID_DEFAULT_REFRESH_TOKEN_TTL = 3600 * 24
 
+        if not hasattr(settings, 'OPENID_JWT_CIPHER'):
+            # algorithm of the id tokens. RS256 is the default required by the OpenID Connect spec,
+            # ES256 is much cheaper to sign (see JWT_ALGORITHM_COST in utils/jwt.py)
+            settings.OPENID_JWT_CIPHER = 'RS256'
+
         if not hasattr(settings, 'OPENID_CONNECT_OP_DB_ENCRYPT_KEY'):
             key = settings.SECRET_KEY
             while len(key)<16:
@@ -2,6 +2,7 @@ import datetime
 import hashlib
 import logging
 import re
+from functools import lru_cache
 
 from django.db.models import Sum
 from jsonfield.fields import JSONField
@@ -12,16 +13,28 @@ try:
 except ImportError:
     import openid_connect_op.utils.secrets_backport as secrets
 
-from urllib.parse import urlparse, splitquery, parse_qs
+from urllib.parse import unquote_plus
 
 import jsonfield
 from django.contrib.auth.hashers import get_hasher, check_password
 from django.contrib.auth.models import User
 from django.db import models
 from django.utils import timezone
+from django.utils.functional import cached_property
 
 log = logging.getLogger(__file__)
 
+_BLANK_QUERY_VALUE = frozenset([''])
+
+
+@lru_cache(maxsize=32)
+def _parse_jwks(jwks):
+    """
+    Parses the serialized key set. Keyed by the raw JSON, so a changed key set is simply a new entry.
+    The returned JWKSet is shared and must not be modified - use OpenIDClient.get_keys instead.
+    """
+    return JWKSet.from_json(jwks)
+
 
 class OpenIDClient(models.Model):
     """
@@ -157,75 +170,89 @@ class OpenIDClient(models.Model):
         :param _redirect_uri: URI sent in the Authorization request
         :return:            True if it is among the configured URIs, False otherwise
         """
-        part = urlparse(_redirect_uri)
-        if part.fragment:
+        # a fragment always starts with '#', elsewhere in the uri it has to be percent-encoded
+        if '#' in _redirect_uri:
             log.debug("Can not contain fragment: %s", _redirect_uri)
             return False
 
-        _base, _query = self.__split_base_query(_redirect_uri)
+        # The base of URI MUST exactly match the base, the query is parsed only if some base does
+        registered_queries = self._parsed_redirect_uris.get(_redirect_uri.partition('?')[0])
+        if registered_queries:
+            _base, _query = self.__split_base_query(_redirect_uri)
+            for redirect_uri_query in registered_queries:
+                if self.__queries_match(redirect_uri_query, _query):
+                    return True
 
-        for potential_redirect_uri in self.redirect_uris.split():
-            redirect_uri_base, redirect_uri_query = self.__split_base_query(potential_redirect_uri)
+        log.debug("%s Doesn't match any registered uris %s", _redirect_uri, self.redirect_uris)
+        return False
 
-            # The base of URI MUST exactly match the base
-            if _base != redirect_uri_base:
-                continue
+    @cached_property
+    def _parsed_redirect_uris(self):
+        """
+        Registered redirect uris split by __split_base_query, as base -> list of parsed queries.
+        Dropped on save() and refresh_from_db()
+        """
+        parsed_uris = {}
+        for uri in self.redirect_uris.split():
+            base, query = self.__split_base_query(uri)
+            parsed_uris.setdefault(base, []).append(query)
+        return parsed_uris
 
-            class NotFoundException(Exception):
-                pass
-
-            try:
-                # every registered query component must exist in the
-                # redirect_uri
-                if redirect_uri_query:
-                    for key, vals in redirect_uri_query.items():
-                        if not _query or key not in _query:
-                            raise NotFoundException()
-
-                        for val in vals:
-                            if val and val not in _query[key]:
-                                raise NotFoundException()
-
-                # and vice versa, every query component in the redirect_uri
-                # must be registered
-                if _query:
-                    if redirect_uri_query is None:
-                        raise NotFoundException()
-                    for key, vals in _query.items():
-                        if key not in redirect_uri_query:
-                            raise NotFoundException()
-                        for val in vals:
-                            if redirect_uri_query[key]:
-                                if val not in redirect_uri_query[key] and '' not in redirect_uri_query[key]:
-                                    raise NotFoundException()
-                # found it, so return True
-                return True
-            except NotFoundException:
-                pass
+    @staticmethod
+    def __queries_match(registered_query, query):
+        registered_query = registered_query or {}
+        query = query or {}
+
+        # every registered query component must exist in the redirect_uri
+        # (a registered parameter without value matches any value)
+        if not all(key in query and vals - _BLANK_QUERY_VALUE <= query[key]
+                   for key, vals in registered_query.items()):
+            return False
 
-        log.debug("%s Doesn't match any registered uris %s", _redirect_uri, self.redirect_uris)
-        return False
+        # and vice versa, every query component in the redirect_uri
+        # must be registered
+        return all(key in registered_query and
+                   ('' in registered_query[key] or vals <= registered_query[key])
+                   for key, vals in query.items())
 
     @staticmethod
     def __split_base_query(_redirect_uri):
-        (_base, _query) = splitquery(_redirect_uri)
-        if _query:
-            _query = parse_qs(_query, keep_blank_values=True)
-        return _base, _query
+        """
+        Splits the uri into its base and a dictionary of query parameter -> frozenset of values
+        (None if there is no query)
+        """
+        _base, __, _query = _redirect_uri.partition('?')
+        if not _query:
+            return _base, None
+        parsed_query = {}
+        # the same as parse_qsl(_query, keep_blank_values=True), without its generic overhead
+        for field in _query.split('&'):
+            if not field:
+                continue
+            key, __, val = field.partition('=')
+            parsed_query.setdefault(unquote_plus(key), []).append(unquote_plus(val))
+        return _base, {key: frozenset(vals) for key, vals in parsed_query.items()}
 
     @staticmethod
     def self_instance():
         return OpenIDClient.objects.get(client_id=OpenIDClient.SELF_CLIENT_ID)
 
     def get_keys(self):
+        ret = JWKSet()
         if self.jwks:
-            return JWKSet.from_json(self.jwks)
-        return JWKSet()
+            # the parsed keys are shared, the returned set is a fresh copy so that callers can modify it
+            for key in _parse_jwks(self.jwks)['keys']:
+                ret.add(key)
+        return ret
 
     def get_key(self, alg=None, kid=None):
-        jwks = self.get_keys()
+        """
+        Returns the single key matching alg and kid, raises AttributeError if there is none or more of them.
+
+        The returned JWK is shared with other requests and threads (parsed keys are cached), it must not be modified.
+        """
         ret = []
-        for key in jwks['keys']:
+        for key in (_parse_jwks(self.jwks)['keys'] if self.jwks else ()):
             if alg and key.alg != alg:
                 continue
             if kid and key.key_id != kid:
@@ -239,6 +266,22 @@ class OpenIDClient(models.Model):
 
         return ret[0]
 
+    @staticmethod
+    def clear_key_cache():
+        """
+        Releases the parsed keys shared by get_keys and get_key in this process. Not needed when the keys change,
+        the cache is keyed by the jwks JSON.
+        """
+        _parse_jwks.cache_clear()
+
+    def save(self, *args, **kwargs):
+        self.__dict__.pop('_parsed_redirect_uris', None)
+        super().save(*args, **kwargs)
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.__dict__.pop('_parsed_redirect_uris', None)
+        super().refresh_from_db(*args, **kwargs)
+
     def __str__(self):
         return self.client_name
 
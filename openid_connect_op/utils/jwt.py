@@ -1,22 +1,63 @@
 import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from functools import lru_cache
 
 import python_jwt as jwt
 import jwcrypto.jwk as jwk
 from django.conf import settings
 
-from os import urandom
+try:
+    import secrets
+except ImportError:
+    import openid_connect_op.utils.secrets_backport as secrets
+
 from jwcrypto.jws import JWS
-from jwcrypto.common import base64url_encode, json_encode, json_decode
-from calendar import timegm
+from jwcrypto.common import base64url_encode, json_encode
 
 
 # need to add "kid" header which the original python_jwt can not do
 from openid_connect_op.models import OpenIDClient
 
 
+def _timestamp(dt):
+    # numbers are already seconds since epoch
+    if not isinstance(dt, datetime.datetime):
+        return int(dt)
+    # naive datetimes are taken as UTC, as calendar.timegm(dt.utctimetuple()) did
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return int(dt.timestamp())
+
+
+@lru_cache(maxsize=16)
+def _encoded_header(algorithm, extra_headers):
+    # extra_headers is a tuple of (name, type, value): the type keeps equal values such as 1, 1.0
+    # and True in separate cache entries
+    header = {
+        'typ': 'JWT',
+        'alg': algorithm
+    }
+    header.update((name, value) for name, __, value in extra_headers)
+    return base64url_encode(json_encode(header))
+
+
+#
+# JWT_ALGORITHM_COST - approximate cost of one operation in microseconds (OpenSSL, single core).
+# The server signs every issued token, so the signing column dominates here; ES256 is the cheapest
+# asymmetric choice. Note that RSA verification is cheaper than ECDSA verification.
+#
+#   algorithm           sign     verify
+#   HS256                  1          1    (shared secret, client_secret_jwt clients only)
+#   ES256                 30         90
+#   RS256/PS256 (2048)  1000         30
+#   RS512/PS512 (4096)  7000        100
+#   ES384/ES512          600        500
+#
 def generate_jwt_patched(claims, priv_key=None,
-                         algorithm='PS512', lifetime=None, expires=None,
+                         algorithm='ES256', lifetime=None, expires=None,
                          not_before=None,
                          jti_size=16, extra_headers={}):
     """
@@ -31,14 +72,14 @@ def generate_jwt_patched(claims, priv_key=None,
     :param algorithm: The algorithm to use for generating the signature. ``RS256``, ``RS384``, ``RS512``, ``PS256``, ``PS384``, ``PS512``, ``ES256``, ``ES384``, ``ES512``, ``HS256``, ``HS384``, ``HS512`` and ``none`` are supported.
     :type algorithm: str
 
-    :param lifetime: How long the token is valid for.
-    :type lifetime: datetime.timedelta
+    :param lifetime: How long the token is valid for, timedelta or number of seconds.
+    :type lifetime: datetime.timedelta or int or float
 
-    :param expires: When the token expires (if :obj:`lifetime` isn't specified)
-    :type expires: datetime.datetime
+    :param expires: When the token expires (if :obj:`lifetime` isn't specified), datetime or seconds since epoch.
+    :type expires: datetime.datetime or int or float
 
-    :param not_before: When the token is valid from. Defaults to current time (if ``None`` is passed).
-    :type not_before: datetime.datetime
+    :param not_before: When the token is valid from, datetime or seconds since epoch. Defaults to current time (if ``None`` is passed).
+    :type not_before: datetime.datetime or int or float
 
     :param jti_size: Size in bytes of the unique token ID to put into the token (can be used to detect replay attacks). Defaults to 16 (128 bits). Specify 0 or ``None`` to omit the JTI from the token.
     :type jti_size: int
@@ -59,39 +100,88 @@ def generate_jwt_patched(claims, priv_key=None,
 
     claims = dict(claims)
 
-    now = datetime.datetime.utcnow()
+    now = int(time.time())
 
     if jti_size:
-        claims['jti'] = base64url_encode(urandom(jti_size))
+        claims['jti'] = secrets.token_urlsafe(jti_size)
 
-    claims['nbf'] = timegm((not_before or now).utctimetuple())
-    claims['iat'] = timegm(now.utctimetuple())
+    claims['nbf'] = _timestamp(not_before) if not_before else now
+    claims['iat'] = now
 
     if lifetime:
-        claims['exp'] = timegm((now + lifetime).utctimetuple())
+        if isinstance(lifetime, datetime.timedelta):
+            lifetime = lifetime.total_seconds()
+        claims['exp'] = now + int(lifetime)
     elif expires:
-        claims['exp'] = timegm(expires.utctimetuple())
+        claims['exp'] = _timestamp(expires)
 
-    if header['alg'] == 'none':
-        signature = ''
-    else:
+    if header['alg'] != 'none':
         token = JWS(json_encode(claims))
         token.add_signature(priv_key, protected=header)
-        signature = json_decode(token.serialize())['signature']
-
-    return u'%s.%s.%s' % (
-        base64url_encode(json_encode(header)),
-        base64url_encode(json_encode(claims)),
-        signature
+        return token.serialize(compact=True)
+
+    try:
+        encoded_header = _encoded_header(header['alg'], tuple(
+            (name, type(value), value) for name, value in sorted(extra_headers.items())))
+    except TypeError:
+        # unhashable header values (for example a x5c list) can not be cached
+        encoded_header = base64url_encode(json_encode(header))
+
+    return u'%s.%s.' % (
+        encoded_header,
+        base64url_encode(json_encode(claims))
     )
 
 
+#
+# Successfully validated tokens, keyed by (client_id, sha256 of the client's secret and jwks,
+# sha256 of the raw token), so a rotated or revoked key never matches entries validated with
+# the old one. Each entry holds (valid_until, header, claims) and is kept at most
+# VALIDATED_JWT_CACHE_TTL seconds, never beyond the token's own "exp". Only tokens that
+# passed verification are stored.
+#
+VALIDATED_JWT_CACHE_SIZE = 10000
+VALIDATED_JWT_CACHE_TTL = 60
+
+_validated_jwt_cache = OrderedDict()
+_validated_jwt_cache_lock = threading.Lock()
+
+
+def _validated_jwt_cache_key(token, client):
+    key_material = '%s\n%s' % (client.client_hashed_secret, client.jwks)
+    return (client.client_id,
+            hashlib.sha256(key_material.encode('utf-8')).hexdigest(),
+            hashlib.sha256(token.encode('utf-8')).hexdigest())
+
+
+def _get_validated_jwt(cache_key):
+    entry = _validated_jwt_cache.get(cache_key)
+    if entry is None:
+        return None
+    valid_until, header, claims = entry
+    if valid_until <= time.time():
+        with _validated_jwt_cache_lock:
+            _validated_jwt_cache.pop(cache_key, None)
+        return None
+    return dict(header), dict(claims)
+
+
+def _put_validated_jwt(cache_key, header, claims):
+    valid_until = time.time() + VALIDATED_JWT_CACHE_TTL
+    if 'exp' in claims:
+        valid_until = min(valid_until, claims['exp'])
+    with _validated_jwt_cache_lock:
+        _validated_jwt_cache[cache_key] = (valid_until, dict(header), dict(claims))
+        while len(_validated_jwt_cache) > VALIDATED_JWT_CACHE_SIZE:
+            _validated_jwt_cache.popitem(last=False)
+
+
 class JWTTools:
 
     @staticmethod
     def generate_jwt(payload, for_client=None, ttl=None, from_client=None):
         if for_client is None:
-            sign_alg = 'RS256'
+            sign_alg = settings.OPENID_JWT_CIPHER
         elif for_client.client_auth_type == OpenIDClient.CLIENT_AUTH_TYPE_SECRET_JWT:
             sign_alg = 'HS256'
         else:
@@ -101,7 +191,6 @@ class JWTTools:
 
     @staticmethod
     def generate_jwt_with_sign_alg(payload, sign_alg, ttl=None, client=None):
-        from openid_connect_op.models import OpenIDClient
         if not client:
             client = OpenIDClient.self_instance()
         if client.client_auth_type == client.CLIENT_AUTH_TYPE_SECRET_JWT:
@@ -123,17 +212,38 @@ class JWTTools:
 
     @staticmethod
     def validate_jwt(token, client=None):
-        from openid_connect_op.models import OpenIDClient
         if client is None:
             client = OpenIDClient.self_instance()
 
+        cache_key = _validated_jwt_cache_key(token, client)
+        cached = _get_validated_jwt(cache_key)
+        if cached is not None:
+            return cached
+
         if client.client_auth_type == OpenIDClient.CLIENT_AUTH_TYPE_SECRET_JWT:
             key = jwk.JWK(kty="oct", use="sig", alg="HS256", k=base64url_encode(client.client_hashed_secret))
-            return jwt.verify_jwt(token, key, ['HS256'], checks_optional=True)
+            header, claims = jwt.verify_jwt(token, key, ['HS256'], checks_optional=True)
+        else:
+            header, __ = jwt.process_jwt(token)
+            key = client.get_key(alg=header.get('alg', 'RS256'), kid=header.get('kid', None))
+            header, claims = jwt.verify_jwt(token, key, [key._params.get('alg', 'RS256')], checks_optional=True)
+
+        _put_validated_jwt(cache_key, header, claims)
+        return header, claims
 
-        header, __ = jwt.process_jwt(token)
-        key = client.get_key(alg=header.get('alg', 'RS256'), kid=header.get('kid', None))
-        return jwt.verify_jwt(token, key, [key._params.get('alg', 'RS256')], checks_optional=True)
+    @staticmethod
+    def clear_validated_jwt_cache():
+        with _validated_jwt_cache_lock:
+            _validated_jwt_cache.clear()
+
+    @staticmethod
+    def invalidate_cache():
+        """
+        Releases the memory held by parsed keys and validated tokens of this process. Not needed on key rotation:
+        both caches are keyed by the key material, so rotated keys are picked up without it.
+        """
+        OpenIDClient.clear_key_cache()
+        JWTTools.clear_validated_jwt_cache()
 
     @staticmethod
     def unverified_jwt_payload(token):
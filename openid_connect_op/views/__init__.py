@@ -1,4 +1,5 @@
 import json
+from collections import ChainMap
 from urllib.parse import urlencode
 
 from django.conf import settings
@@ -17,13 +18,12 @@ class OAuthRequestMixin:
     attribute_parsing_error = 'invalid_request'
 
     def oauth_send_answer(self, request, response_params):
-        actual_params = {}
-        actual_params.update(response_params)
         redirect_uri = getattr(self.request_parameters, 'redirect_uri', None) or \
                        request.GET.get('redirect_uri', None) or \
                        request.POST.get('redirect_uri', None)
-        if hasattr(self.request_parameters, 'state') and self.request_parameters.state:
-            actual_params['state'] = self.request_parameters.state
+        # response_params are copied only when state has to be added to them
+        state = getattr(self.request_parameters, 'state', None)
+        actual_params = dict(response_params, state=state) if state else response_params
 
         if hasattr(self.request_parameters, 'response_mode') and 'form_post' in self.request_parameters.response_mode:
             resp = render(request, 'django-open-id/form_post_response_mode.html', {
@@ -42,25 +42,25 @@ class OAuthRequestMixin:
                     status = 400
             return JsonResponse(actual_params, status=status)
 
-        if '?' in redirect_uri:
-            redirect_uri += '&'
-        else:
-            redirect_uri += '?'
-        redirect_uri += urlencode(actual_params)
-        return HttpResponseRedirect(redirect_uri)
+        if not actual_params:
+            return HttpResponseRedirect(redirect_uri)
+
+        return HttpResponseRedirect('%s%s%s' % (
+            redirect_uri,
+            '&' if '?' in redirect_uri else '?',
+            urlencode(actual_params)
+        ))
 
     def parse_request_parameters(self, request, parameters_class):
         try:
+            # parameters_class only looks the values up, so no need to copy them into a new dict
             if request.method == 'GET':
-                params = {k: v for k, v in request.GET.items()}
+                params = request.GET
             else:
-                params = {}
-                if request.GET:
-                    params.update({k: v for k, v in request.GET.items()})
-                if request.POST:
-                    params.update({k: v for k, v in request.POST.items()})
+                # values from POST take precedence over the query string, json body over both
+                params = ChainMap(request.POST, request.GET)
                 if request.content_type == 'application/json':
-                    params.update(json.loads(request.body.decode('utf-8')))
+                    params = params.new_child(json.loads(request.body.decode('utf-8')))
 
             # noinspection PyAttributeOutsideInit
             self.request_parameters = parameters_class(params)
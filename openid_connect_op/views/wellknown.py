@@ -31,6 +31,9 @@ class WellKnownView(View):
         resp = {}
         print("returning wellknown")
         resp.update(self.defaults)
+        if settings.OPENID_JWT_CIPHER not in resp['id_token_signing_alg_values_supported']:
+            resp['id_token_signing_alg_values_supported'] = \
+                resp['id_token_signing_alg_values_supported'] + [settings.OPENID_JWT_CIPHER]
         resp.update(self.extra)
         resp['issuer'] = request.build_absolute_uri('/')
         resp['authorization_endpoint'] = request.build_absolute_uri(reverse('openid_connect_op:authorize'))
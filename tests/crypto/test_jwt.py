@@ -0,0 +1,119 @@
+import datetime
+import json
+
+import pytest
+from jwcrypto.common import base64url_decode
+
+from openid_connect_op.models import OpenIDClient
+from openid_connect_op.utils import jwt as jwt_utils
+from openid_connect_op.utils.jwt import JWTTools
+
+
+@pytest.fixture
+def sjwt_client():
+    JWTTools.clear_validated_jwt_cache()
+    client = OpenIDClient(client_id='test',
+                          client_auth_type=OpenIDClient.CLIENT_AUTH_TYPE_SECRET_JWT)
+    client.set_client_secret('very secret')
+    yield client
+    JWTTools.clear_validated_jwt_cache()
+
+
+def make_token(client, ttl=60):
+    return JWTTools.generate_jwt_with_sign_alg({'a': 'b'}, 'HS256', ttl=ttl, client=client)
+
+
+def test_validated_jwt_is_cached(sjwt_client, monkeypatch):
+    token = make_token(sjwt_client)
+    header, payload = JWTTools.validate_jwt(token, sjwt_client)
+    assert payload['a'] == 'b'
+
+    def fail(*args, **kwargs):
+        raise AssertionError('Should have been served from cache')
+
+    monkeypatch.setattr(jwt_utils.jwt, 'verify_jwt', fail)
+    assert JWTTools.validate_jwt(token, sjwt_client) == (header, payload)
+
+
+def test_invalid_jwt_is_not_cached(sjwt_client):
+    token = make_token(sjwt_client)
+    tampered = token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB')
+    for __ in range(2):
+        with pytest.raises(Exception):
+            JWTTools.validate_jwt(tampered, sjwt_client)
+    assert not jwt_utils._validated_jwt_cache
+
+
+def test_cache_is_per_client(sjwt_client):
+    token = make_token(sjwt_client)
+    JWTTools.validate_jwt(token, sjwt_client)
+
+    other_client = OpenIDClient(client_id='other',
+                                client_auth_type=OpenIDClient.CLIENT_AUTH_TYPE_SECRET_JWT)
+    other_client.set_client_secret('another secret')
+    with pytest.raises(Exception):
+        JWTTools.validate_jwt(token, other_client)
+
+
+def test_cache_not_used_after_secret_change(sjwt_client):
+    token = make_token(sjwt_client)
+    JWTTools.validate_jwt(token, sjwt_client)
+
+    sjwt_client.set_client_secret('rotated secret')
+    with pytest.raises(Exception):
+        JWTTools.validate_jwt(token, sjwt_client)
+
+
+def test_cache_entry_expires_with_token(sjwt_client, monkeypatch):
+    token = make_token(sjwt_client, ttl=1)
+    JWTTools.validate_jwt(token, sjwt_client)
+
+    now = jwt_utils.time.time()
+    monkeypatch.setattr(jwt_utils.time, 'time', lambda: now + 5)
+    assert jwt_utils._get_validated_jwt(jwt_utils._validated_jwt_cache_key(token, sjwt_client)) is None
+
+
+def test_generated_jwt_timestamps():
+    not_before = datetime.datetime(2030, 1, 1, 12, 0, 0)
+    expires = datetime.datetime(2030, 1, 1, 13, 0, 0, tzinfo=datetime.timezone.utc)
+    token = jwt_utils.generate_jwt_patched({'a': 'b'}, not_before=not_before, expires=expires)
+    payload = JWTTools.unverified_jwt_payload(token)
+    assert payload['nbf'] == 1893499200
+    assert payload['exp'] == 1893502800
+
+    before = int(jwt_utils.time.time())
+    token = jwt_utils.generate_jwt_patched({'a': 'b'}, lifetime=datetime.timedelta(minutes=1))
+    payload = JWTTools.unverified_jwt_payload(token)
+    assert before <= payload['iat'] == payload['nbf'] <= before + 1
+    assert payload['exp'] == payload['iat'] + 60
+
+    token = jwt_utils.generate_jwt_patched({'a': 'b'}, lifetime=60)
+    payload = JWTTools.unverified_jwt_payload(token)
+    assert payload['exp'] == payload['iat'] + 60
+
+    token = jwt_utils.generate_jwt_patched({'a': 'b'}, lifetime=60.5)
+    payload = JWTTools.unverified_jwt_payload(token)
+    assert payload['exp'] == payload['iat'] + 60
+
+    token = jwt_utils.generate_jwt_patched({'a': 'b'}, not_before=1893499200, expires=1893502800.5)
+    payload = JWTTools.unverified_jwt_payload(token)
+    assert payload['nbf'] == 1893499200
+    assert payload['exp'] == 1893502800
+
+
+def test_unsigned_jwt():
+    for extra_headers in ({}, {'kid': 'abc'}, {'x5c': ['a']}):
+        token = jwt_utils.generate_jwt_patched({'a': 1}, None, extra_headers=extra_headers)
+        header, payload, signature = token.split('.')
+        assert signature == ''
+        expected_header = {'typ': 'JWT', 'alg': 'none'}
+        expected_header.update(extra_headers)
+        assert json.loads(base64url_decode(header).decode('utf-8')) == expected_header
+        assert JWTTools.unverified_jwt_payload(token)['a'] == 1
+
+
+def test_unsigned_jwt_header_types():
+    for value in (1, True, 1.0, 0, False):
+        token = jwt_utils.generate_jwt_patched({'a': 1}, None, extra_headers={'x': value})
+        header = json.loads(base64url_decode(token.split('.')[0]).decode('utf-8'))
+        assert header['x'] == value and type(header['x']) is type(value)
@@ -4,7 +4,9 @@ import pytest
 import time
 from django.core.management import call_command
 import jwcrypto.jwk as jwk
+import python_jwt as jwt
 
+from openid_connect_op.models import OpenIDClient
 from openid_connect_op.utils.jwt import JWTTools
 
 
@@ -36,4 +38,25 @@ class TestJWKS:
             for extra in ('iat', 'jti', 'nbf'):
                 if extra in decrypted_payload:
                     decrypted_payload.pop(extra)
-            assert decrypted_payload == payload
\ No newline at end of file
+            assert decrypted_payload == payload
+
+    def test_get_keys_returns_copy(self):
+        client = OpenIDClient.self_instance()
+        keys = client.get_keys()
+        keys['keys'].clear()
+        assert len(client.get_keys()['keys']) >= 1
+        assert client.get_key(alg='RS256').key_id
+
+    def test_rotated_keys_are_used_without_signals(self):
+        JWTTools.generate_jwt_with_sign_alg({'a': 'b'}, 'ES256')
+
+        new_key = jwk.JWK.generate(kty='EC', crv='P-256', alg='ES256', kid='rotated')
+        jwks = jwk.JWKSet()
+        jwks['keys'].add(new_key)
+        # queryset update does not send post_save
+        OpenIDClient.objects.filter(client_id=OpenIDClient.SELF_CLIENT_ID).update(
+            jwks=jwks.export(private_keys=True))
+
+        token = JWTTools.generate_jwt_with_sign_alg({'a': 'b'}, 'ES256')
+        assert JWTTools.unverified_jwt_payload(token)['a'] == 'b'
+        assert jwt.process_jwt(token)[0]['kid'] == 'rotated'
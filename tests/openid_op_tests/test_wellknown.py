@@ -40,3 +40,9 @@ class TestWellKnownURL:
             'userinfo_signing_alg_values_supported': ['RS256'],
             'userinfo_endpoint': 'http://testserver/openid/userinfo'
         }
+
+    def test_wellknown_with_es256(self, client, settings):
+        settings.OPENID_JWT_CIPHER = 'ES256'
+        resp = client.get('/.well-known/openid-configuration')
+        data = json.loads(resp.content.decode('utf-8'))
+        assert data['id_token_signing_alg_values_supported'] == ['RS256', 'ES256']
@@ -1,3 +1,5 @@
+import pytest
+
 from openid_connect_op.models import OpenIDClient
 
 
@@ -36,3 +38,38 @@ class TestRedirectURIMatching:
         assert not client_config.check_redirect_url('http://my-site.com/auth/complete?a=3')
         assert not client_config.check_redirect_url('http://my-site.com/auth/complete?a')
 
+    def test_fragment_not_allowed(self):
+        client_config = OpenIDClient(redirect_uris='http://my-site.com/auth/complete')
+        assert not client_config.check_redirect_url('http://my-site.com/auth/complete#abc')
+
+    def test_match_with_repeated_param(self):
+        client_config = OpenIDClient(redirect_uris='http://my-site.com/auth/complete?a=1&a=2&b')
+        assert client_config.check_redirect_url('http://my-site.com/auth/complete?a=1&a=2&b=x')
+        assert client_config.check_redirect_url('http://my-site.com/auth/complete?b=x&a=2&a=1')
+        assert not client_config.check_redirect_url('http://my-site.com/auth/complete?a=1&b=x')
+        assert not client_config.check_redirect_url('http://my-site.com/auth/complete?a=1&a=2&a=3&b=x')
+
+    @pytest.mark.django_db
+    def test_changed_uris_after_save(self):
+        client_config = OpenIDClient.objects.create(client_id='test', redirect_uris='http://my-site.com/auth/complete')
+        assert client_config.check_redirect_url('http://my-site.com/auth/complete')
+        client_config.redirect_uris = 'http://my-site1.com/auth/complete'
+        client_config.save()
+        assert not client_config.check_redirect_url('http://my-site.com/auth/complete')
+        assert client_config.check_redirect_url('http://my-site1.com/auth/complete')
+
+    def test_empty_fragment_not_allowed(self):
+        client_config = OpenIDClient(redirect_uris='http://my-site.com/auth/complete')
+        assert not client_config.check_redirect_url('http://my-site.com/auth/complete#')
+
+    def test_match_with_encoded_param(self):
+        client_config = OpenIDClient(redirect_uris='http://my-site.com/auth/complete?a=x%20y&b=')
+        assert client_config.check_redirect_url('http://my-site.com/auth/complete?a=x+y&&b=1')
+        assert not client_config.check_redirect_url('http://my-site.com/auth/complete?a=x%2By&b=1')
+
+    def test_match_same_base_different_params(self):
+        client_config = OpenIDClient(redirect_uris='http://my-site.com/auth/complete?a=1\n'
+                                                   'http://my-site.com/auth/complete?b=2')
+        assert client_config.check_redirect_url('http://my-site.com/auth/complete?a=1')
+        assert client_config.check_redirect_url('http://my-site.com/auth/complete?b=2')
+        assert not client_config.check_redirect_url('http://my-site.com/auth/complete?a=1&b=2')